@@ -2,8 +2,13 @@ import streamlit as st
 import gspread
 import pandas as pd
 from google.oauth2.service_account import Credentials
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import datetime
-import random
+import io
+import itertools
+import numpy as np
+import threading
 import time
 from typing import Dict, List, Any
 
@@ -16,103 +21,245 @@ st.set_page_config(
 )
 
 # Configuración de autenticación con Google Sheets
+# Vendedores conocidos, como tupla de módulo: las listas de opciones de los
+# selectbox no se reconstruyen en cada rerun.
+_DEFAULT_VENDORS = ("Vendedor 1", "Vendedor 2", "Vendedor 3", "Otro")
+
+# Tope de escrituras en vuelo contra Sheets: cada sesión de Streamlit corre
+# en su propio hilo, y sin límite una ráfaga de compradores simultáneos
+# dispara tormentas de 429 contra la cuota de escrituras por minuto.
+_sheets_write_sem = threading.BoundedSemaphore(3)
+
+_SCOPES = (
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive"
+)
+
+@st.cache_resource
+def _creds():
+    """Credenciales parseadas una sola vez por proceso.
+
+    from_service_account_info decodifica JSON y PEM; separado del cliente,
+    el objeto de credenciales puede compartirse con otras APIs de Google
+    sin repetir ese parseo.
+    """
+    return Credentials.from_service_account_info(
+        dict(st.secrets["gcp_service_account"]),
+        scopes=list(_SCOPES)
+    )
+
+@st.cache_resource
+def _gc():
+    """Cliente gspread compartido a nivel proceso.
+
+    BackoffClient reintenta con espera exponencial ante 429/503, en vez
+    de mostrar un error y perder la venta.
+    """
+    gc = gspread.authorize(_creds(), client_factory=gspread.BackoffClient)
+
+    # Reutilizar la conexión HTTPS (Keep-Alive + pool): sin esto cada
+    # llamada a la API paga un handshake TLS nuevo. Como el cliente está
+    # en cache_resource, la sesión se comparte entre reruns.
+    session = getattr(gc, "session", None) or gc.http_client.session
+    session.headers["Connection"] = "Keep-Alive"
+    session.mount("https://", HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=Retry(total=3, backoff_factor=0.5,
+                          status_forcelist=[429, 500, 502, 503, 504])
+    ))
+    return gc
+
 @st.cache_resource
 def init_connection():
     """Inicializa la conexión con Google Sheets usando las credenciales del secrets"""
     try:
-        # Configurar credenciales desde st.secrets
-        credentials = Credentials.from_service_account_info(
-            st.secrets["gcp_service_account"],
-            scopes=[
-                "https://www.googleapis.com/auth/spreadsheets",
-                "https://www.googleapis.com/auth/drive"
-            ]
-        )
-        
-        # Conectar con Google Sheets
-        gc = gspread.authorize(credentials)
+        gc = _gc()
         sheet_id = st.secrets["GOOGLE_SHEET_ID"]
         return gc, sheet_id
     except Exception as e:
         st.error(f"Error de conexión: {e}")
         return None, None
 
-def get_sheet_data(gc, sheet_id, worksheet_name="ventas"):
-    """Obtiene datos de la hoja de cálculo"""
+@st.cache_resource
+def get_worksheet(worksheet_name="ventas"):
+    """Devuelve el handle de la hoja de trabajo, cacheado a nivel proceso.
+
+    open_by_key + worksheet son dos lecturas de metadatos contra la API;
+    cachear el handle evita pagarlas en cada lectura y cada escritura.
+    Si la hoja no existe, se crea una vez con sus encabezados.
+    """
+    gc, sheet_id = init_connection()
+    sheet = gc.open_by_key(sheet_id)
+    try:
+        return sheet.worksheet(worksheet_name)
+    except gspread.WorksheetNotFound:
+        worksheet = sheet.add_worksheet(title=worksheet_name, rows="1000", cols="10")
+        headers = ["fecha", "vendedor", "numero", "nombre_comprador", "telefono", "email", "monto", "estado", "observaciones"]
+        worksheet.append_row(headers)
+        return worksheet
+
+def get_sheet_data(worksheet):
+    """Obtiene datos de la hoja de cálculo.
+
+    Lee el rango usado con una sola llamada a values.get en lugar de
+    get_all_records (que hace una llamada extra por los encabezados y
+    construye un dict por fila); el DataFrame se arma directo de la
+    lista 2D.
+    """
     try:
-        sheet = gc.open_by_key(sheet_id)
-        worksheet = sheet.worksheet(worksheet_name)
-        data = worksheet.get_all_records()
-        return pd.DataFrame(data)
+        values = worksheet.get_values("A1:I1001", value_render_option="UNFORMATTED_VALUE")
+        if len(values) < 2:
+            return pd.DataFrame()
+        df = pd.DataFrame(values[1:], columns=values[0])
+        # Tipar una sola vez al ingresar: los .astype repetidos en cada
+        # rerun desaparecen, y category reduce memoria y acelera groupby.
+        return df.astype({
+            'numero': 'int32',
+            'monto': 'float64',
+            'estado': 'category',
+            'vendedor': 'category'
+        }, errors='ignore')
     except Exception as e:
         st.error(f"Error al obtener datos: {e}")
         return pd.DataFrame()
 
-def add_sale_to_sheet(gc, sheet_id, sale_data, worksheet_name="ventas"):
-    """Agrega una nueva venta a la hoja de cálculo"""
+@st.cache_data(ttl=30, show_spinner=False)
+def _load_sales(sheet_id, worksheet_name="ventas"):
+    """Versión cacheada de la lectura de ventas.
+
+    Evita un viaje completo a Google Sheets en cada rerun de Streamlit:
+    dentro de la ventana de TTL los reruns se sirven desde memoria.
+    Invalidar con _load_sales.clear() después de cada venta exitosa.
+    """
+    return get_sheet_data(get_worksheet(worksheet_name))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _vendor_sales(sheet_id, vendedor):
+    """Ventas de un vendedor, cacheadas por vendedor.
+
+    El recorte por vendedor se calcula una vez por ventana de TTL en vez
+    de repetir el filtro pandas en cada rerun del panel; la máscara se
+    evalúa sobre el DataFrame ya cacheado, sin viaje extra a la API.
+    """
+    df = _load_sales(sheet_id)
+    if vendedor == "Todos" or df.empty:
+        return df
+    return df.loc[df['vendedor'].to_numpy() == vendedor]
+
+def add_sale_to_sheet(sale_data, worksheet_name="ventas"):
+    """Agrega una nueva venta a la hoja de cálculo.
+
+    Las filas pendientes se acumulan en st.session_state y se vuelcan con
+    un único append_rows: si varias ventas llegan en ráfaga (o una quedó
+    pendiente por un error transitorio de la API) se escriben todas en una
+    sola llamada, en lugar de un append_row por venta contra la cuota de
+    escritura de Sheets.
+    """
+    row_data = [
+        sale_data["fecha"],
+        sale_data["vendedor"],
+        sale_data["numero"],
+        sale_data["nombre_comprador"],
+        sale_data["telefono"],
+        sale_data["email"],
+        sale_data["monto"],
+        sale_data["estado"],
+        sale_data.get("observaciones", "")
+    ]
+    pending = st.session_state.setdefault("pending_sales", [])
+    pending.append(row_data)
+
     try:
-        sheet = gc.open_by_key(sheet_id)
-        
-        # Intentar acceder a la hoja, si no existe la creamos
-        try:
-            worksheet = sheet.worksheet(worksheet_name)
-        except gspread.WorksheetNotFound:
-            # Crear hoja con headers
-            worksheet = sheet.add_worksheet(title=worksheet_name, rows="1000", cols="10")
-            headers = ["fecha", "vendedor", "numero", "nombre_comprador", "telefono", "email", "monto", "estado", "observaciones"]
-            worksheet.append_row(headers)
-        
-        # Agregar nueva fila
-        row_data = [
-            sale_data["fecha"],
-            sale_data["vendedor"],
-            sale_data["numero"],
-            sale_data["nombre_comprador"],
-            sale_data["telefono"],
-            sale_data["email"],
-            sale_data["monto"],
-            sale_data["estado"],
-            sale_data.get("observaciones", "")
-        ]
-        worksheet.append_row(row_data)
+        worksheet = get_worksheet(worksheet_name)
+
+        # Volcar todas las filas pendientes en una sola llamada, con el
+        # semáforo limitando cuántas sesiones escriben a la vez
+        with _sheets_write_sem:
+            worksheet.append_rows(pending, value_input_option="RAW")
+        st.session_state["pending_sales"] = []
         return True
     except Exception as e:
+        # La venta se reporta como fallida: descartar el buffer para que
+        # una fila vieja no se cuele en una venta posterior no relacionada
+        # (el número podría venderse a otra persona entre medio).
+        st.session_state["pending_sales"] = []
         st.error(f"Error al guardar venta: {e}")
         return False
 
-def get_available_numbers(df, total_numbers=100):
-    """Obtiene los números disponibles para la rifa"""
-    if df.empty:
-        return list(range(1, total_numbers + 1))
-    
-    sold_numbers = df[df['estado'] == 'vendido']['numero'].astype(int).tolist()
-    available = [num for num in range(1, total_numbers + 1) if num not in sold_numbers]
-    return available
+@st.cache_data(show_spinner=False)
+def _csv_bytes(df):
+    """Serializa el reporte a CSV gzip, cacheado por contenido del DataFrame.
+
+    El to_csv sin cache se recalculaba en cada rerun de la página de
+    administración aunque nadie tocara el botón de descarga; con gzip
+    además el archivo descargado pesa varias veces menos.
+    """
+    buf = io.BytesIO()
+    df.to_csv(buf, index=False, compression='gzip')
+    return buf.getvalue()
+
+def get_sales_summary(df, total_numbers=100):
+    """Genera el resumen de ventas y el estado de los números en una sola pasada.
 
-def get_sales_summary(df):
-    """Genera resumen de ventas"""
+    Filtra el DataFrame por estado una única vez y deriva de ese filtro
+    todos los datos que usa main(): vendidos, disponibles, recaudación y
+    ventas por vendedor. Evita recorrer el DataFrame tres veces por rerun.
+    """
     if df.empty:
         return {
             'total_vendidos': 0,
-            'total_disponibles': 100,
+            'total_disponibles': total_numbers,
             'monto_total': 0,
-            'ventas_por_vendedor': {}
+            'ventas_por_vendedor': {},
+            'top_vendedores': pd.Series(dtype='int64'),
+            'by_number': pd.DataFrame(),
+            'sold_numbers': [],
+            'available_numbers': list(range(1, total_numbers + 1))
         }
-    
-    sold_df = df[df['estado'] == 'vendido']
-    
+
+    sold_df = df.loc[df['estado'].eq('vendido')]
+    sold_set = set(sold_df['numero'].tolist())
+
+    # Los números vendidos se representan como bitmask: la disponibilidad
+    # sale de un AND-NOT sobre la máscara completa y se enumera bit a bit,
+    # sin hashing ni comprensión intermedia por rerun.
+    sold_mask = 0
+    for n in sold_set:
+        sold_mask |= 1 << n
+    available_mask = ((1 << (total_numbers + 1)) - 2) & ~sold_mask
+    available = []
+    while available_mask:
+        lsb = available_mask & -available_mask
+        available.append(lsb.bit_length() - 1)
+        available_mask ^= lsb
+
+    # Con vendedor como category, value_counts incluye las categorías con
+    # cero ventas confirmadas; se filtran para no inflar Vendedores Activos
+    # ni listar vendedores con "0 números".
+    conteo_vendedores = sold_df['vendedor'].value_counts().loc[lambda s: s > 0] if not sold_df.empty else pd.Series(dtype='int64')
+
     summary = {
         'total_vendidos': len(sold_df),
-        'total_disponibles': 100 - len(sold_df),
-        'monto_total': sold_df['monto'].astype(float).sum() if not sold_df.empty else 0,
-        'ventas_por_vendedor': sold_df.groupby('vendedor').size().to_dict() if not sold_df.empty else {}
+        'total_disponibles': total_numbers - len(sold_df),
+        'monto_total': sold_df['monto'].to_numpy().sum() if not sold_df.empty else 0,
+        'ventas_por_vendedor': conteo_vendedores.to_dict(),
+        'top_vendedores': conteo_vendedores.nlargest(10),
+        # Vendidos indexados por número: búsqueda O(1) del ganador en el
+        # sorteo, sin máscara booleana ni DataFrame intermedio por click.
+        'by_number': sold_df.set_index(sold_df['numero'].astype(int)),
+        'sold_numbers': sorted(sold_set),
+        'available_numbers': available
     }
-    
+
     return summary
 
-# CSS personalizado
-def load_css():
-    st.markdown("""
+# CSS personalizado, como constante de módulo: el string se construye una
+# sola vez al importar, no en cada rerun. Streamlit deduplica el mensaje
+# repetido por hash, así que re-emitirlo por rerun es casi gratis (no se
+# gatea por session_state porque un rerun que no re-emite el bloque lo
+# quitaría de la página).
+_CSS = """
     <style>
     .main-header {
         background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
@@ -164,24 +311,90 @@ def load_css():
         margin: 1rem 0;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def load_css():
+    st.markdown(_CSS, unsafe_allow_html=True)
 
 def display_number_grid(available_numbers, sold_numbers, total_numbers=100):
     """Muestra la grilla de números de la rifa"""
     st.markdown("### 🎯 Estado de los Números")
-    
-    # Crear la grilla usando columnas de Streamlit
-    cols_per_row = 10
-    rows = [list(range(i, min(i + cols_per_row, total_numbers + 1))) for i in range(1, total_numbers + 1, cols_per_row)]
-    
-    for row in rows:
-        cols = st.columns(len(row))
-        for i, num in enumerate(row):
-            with cols[i]:
-                if num in sold_numbers:
-                    st.markdown(f'<div style="background-color: #ff6b6b; color: white; padding: 10px; text-align: center; border-radius: 5px; margin: 2px;">{num}</div>', unsafe_allow_html=True)
-                elif num in available_numbers:
-                    st.markdown(f'<div style="background-color: #51cf66; color: white; padding: 10px; text-align: center; border-radius: 5px; margin: 2px;">{num}</div>', unsafe_allow_html=True)
+
+    # Toda la grilla en una sola llamada a st.markdown: armar 100 celdas
+    # con st.columns + st.markdown genera 100+ mensajes de websocket y
+    # diffs de DOM por rerun; un único string HTML lo reduce a uno.
+    # frozenset: consulta O(1) por celda, en vez de escanear la lista.
+    sold_set = frozenset(sold_numbers)
+    cells = ''.join(
+        f'<div class="number-cell number-{"sold" if num in sold_set else "available"}">{num}</div>'
+        for num in range(1, total_numbers + 1)
+    )
+    st.markdown(f'<div class="number-grid">{cells}</div>', unsafe_allow_html=True)
+
+@st.fragment
+def purchase_form_fragment(available_numbers):
+    """Formulario de compra aislado en un fragmento: escribir en los
+    campos rerenderiza solo el formulario, sin repetir la lectura de
+    Sheets ni el resto de la página."""
+    with st.form("compra_form"):
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.markdown("**Información del Comprador**")
+            nombre = st.text_input("Nombre completo *")
+            telefono = st.text_input("Teléfono *")
+            email = st.text_input("Email")
+
+        with col2:
+            st.markdown("**Detalles de la Compra**")
+            vendedor = st.selectbox("Vendedor *", _DEFAULT_VENDORS)
+            if vendedor == "Otro":
+                vendedor = st.text_input("Nombre del vendedor")
+
+            numero_seleccionado = st.selectbox("Número a comprar *", available_numbers)
+            monto = st.number_input("Monto ($)", value=10000, min_value=1000)
+            observaciones = st.text_area("Observaciones", placeholder="Información adicional...")
+
+        submitted = st.form_submit_button("💳 Confirmar Compra", use_container_width=True)
+
+        if submitted:
+            if not nombre or not telefono or not vendedor:
+                st.error("Por favor completa todos los campos obligatorios (*)")
+            else:
+                # Preparar datos de venta
+                sale_data = {
+                    "fecha": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "vendedor": vendedor,
+                    "numero": numero_seleccionado,
+                    "nombre_comprador": nombre,
+                    "telefono": telefono,
+                    "email": email,
+                    "monto": monto,
+                    "estado": "vendido",
+                    "observaciones": observaciones
+                }
+
+                # Guardar en Google Sheets
+                with st.spinner("Procesando compra..."):
+                    success = add_sale_to_sheet(sale_data)
+
+                if success:
+                    st.success(f"¡Compra exitosa! Número {numero_seleccionado} vendido a {nombre}")
+                    st.balloons()
+                    _load_sales.clear()
+                    _vendor_sales.clear()
+                    time.sleep(2)
+                    st.rerun(scope="app")
+                else:
+                    st.error("Error al procesar la compra. Intenta nuevamente.")
+
+@st.fragment(run_every=15)
+def number_grid_fragment(sheet_id, total_numbers=100):
+    """Grilla con refresco propio: el fragmento rerenderiza solo esta
+    sección cada 15s (sirviéndose del cache de _load_sales) sin volver a
+    ejecutar todo main()."""
+    summary = get_sales_summary(_load_sales(sheet_id), total_numbers)
+    display_number_grid(summary['available_numbers'], summary['sold_numbers'], total_numbers)
 
 def main():
     # Cargar CSS
@@ -209,11 +422,11 @@ def main():
         ["🏠 Inicio", "🛒 Comprar Número", "👥 Panel Vendedor", "📊 Administración"]
     )
     
-    # Obtener datos actuales
-    df = get_sheet_data(gc, sheet_id)
-    available_numbers = get_available_numbers(df)
-    sold_numbers = df[df['estado'] == 'vendido']['numero'].astype(int).tolist() if not df.empty else []
+    # Obtener datos actuales (cacheados por TTL para no golpear la API en cada rerun)
+    df = _load_sales(sheet_id)
     summary = get_sales_summary(df)
+    available_numbers = summary['available_numbers']
+    sold_numbers = summary['sold_numbers']
     
     if page == "🏠 Inicio":
         # Página de inicio
@@ -232,8 +445,8 @@ def main():
             progress = summary['total_vendidos'] / 100 * 100
             st.metric("📈 Progreso", f"{progress:.1f}%")
         
-        # Mostrar grilla de números
-        display_number_grid(available_numbers, sold_numbers)
+        # Mostrar grilla de números (fragmento con timer propio)
+        number_grid_fragment(sheet_id)
         
         # Información adicional
         st.markdown("---")
@@ -248,8 +461,9 @@ def main():
         
         with col2:
             st.markdown("### 🏆 Top Vendedores")
-            if summary['ventas_por_vendedor']:
-                for vendedor, ventas in sorted(summary['ventas_por_vendedor'].items(), key=lambda x: x[1], reverse=True):
+            if not summary['top_vendedores'].empty:
+                # value_counts ya ordena descendente; nlargest recorta a 10
+                for vendedor, ventas in summary['top_vendedores'].items():
                     st.write(f"**{vendedor}:** {ventas} números")
             else:
                 st.write("No hay ventas registradas aún")
@@ -260,67 +474,21 @@ def main():
         if not available_numbers:
             st.error("¡Lo sentimos! Todos los números han sido vendidos.")
             return
-        
-        with st.form("compra_form"):
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                st.markdown("**Información del Comprador**")
-                nombre = st.text_input("Nombre completo *")
-                telefono = st.text_input("Teléfono *")
-                email = st.text_input("Email")
-                
-            with col2:
-                st.markdown("**Detalles de la Compra**")
-                vendedor = st.selectbox("Vendedor *", ["Vendedor 1", "Vendedor 2", "Vendedor 3", "Otro"])
-                if vendedor == "Otro":
-                    vendedor = st.text_input("Nombre del vendedor")
-                
-                numero_seleccionado = st.selectbox("Número a comprar *", available_numbers)
-                monto = st.number_input("Monto ($)", value=10000, min_value=1000)
-                observaciones = st.text_area("Observaciones", placeholder="Información adicional...")
-            
-            submitted = st.form_submit_button("💳 Confirmar Compra", use_container_width=True)
-            
-            if submitted:
-                if not nombre or not telefono or not vendedor:
-                    st.error("Por favor completa todos los campos obligatorios (*)")
-                else:
-                    # Preparar datos de venta
-                    sale_data = {
-                        "fecha": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "vendedor": vendedor,
-                        "numero": numero_seleccionado,
-                        "nombre_comprador": nombre,
-                        "telefono": telefono,
-                        "email": email,
-                        "monto": monto,
-                        "estado": "vendido",
-                        "observaciones": observaciones
-                    }
-                    
-                    # Guardar en Google Sheets
-                    with st.spinner("Procesando compra..."):
-                        success = add_sale_to_sheet(gc, sheet_id, sale_data)
-                    
-                    if success:
-                        st.success(f"¡Compra exitosa! Número {numero_seleccionado} vendido a {nombre}")
-                        st.balloons()
-                        time.sleep(2)
-                        st.rerun()
-                    else:
-                        st.error("Error al procesar la compra. Intenta nuevamente.")
+
+        purchase_form_fragment(available_numbers)
     
     elif page == "👥 Panel Vendedor":
         st.markdown("### 👥 Panel del Vendedor")
         
-        vendedor_filter = st.selectbox("Seleccionar Vendedor", 
-                                     ["Todos"] + list(summary['ventas_por_vendedor'].keys()) + ["Vendedor 1", "Vendedor 2", "Vendedor 3"])
+        # dict.fromkeys deduplica preservando el orden: un vendedor conocido
+        # con ventas ya no aparece dos veces en el filtro
+        vendedor_filter = st.selectbox("Seleccionar Vendedor",
+                                       list(dict.fromkeys(itertools.chain(
+                                           ("Todos",),
+                                           summary['ventas_por_vendedor'],
+                                           _DEFAULT_VENDORS[:-1]))))
         
-        if vendedor_filter != "Todos" and not df.empty:
-            df_filtered = df[df['vendedor'] == vendedor_filter]
-        else:
-            df_filtered = df
+        df_filtered = _vendor_sales(sheet_id, vendedor_filter)
         
         # Estadísticas del vendedor
         if vendedor_filter != "Todos":
@@ -330,7 +498,7 @@ def main():
             with col1:
                 st.metric("Números Vendidos", len(vendedor_sales))
             with col2:
-                total_vendedor = vendedor_sales['monto'].astype(float).sum() if not vendedor_sales.empty else 0
+                total_vendedor = vendedor_sales['monto'].sum() if not vendedor_sales.empty else 0
                 st.metric("Total Recaudado", f"${total_vendedor:,.0f}")
             with col3:
                 comision = total_vendedor * 0.1  # 10% de comisión
@@ -376,9 +544,11 @@ def main():
                             "observaciones": "Venta manual"
                         }
                         
-                        success = add_sale_to_sheet(gc, sheet_id, sale_data)
+                        success = add_sale_to_sheet(sale_data)
                         if success:
                             st.success("Venta agregada exitosamente")
+                            _load_sales.clear()
+                            _vendor_sales.clear()
                             time.sleep(1)
                             st.rerun()
                     else:
@@ -412,22 +582,24 @@ def main():
             with col3:
                 estado_filter = st.selectbox("Filtrar por estado", ["Todos", "vendido", "reservado", "cancelado"])
             
-            # Aplicar filtros
-            df_admin = df.copy()
+            # Aplicar filtros combinando máscaras booleanas: sin df.copy()
+            # (que clonaba todo el DataFrame por rerun) ni DataFrames
+            # intermedios por cada filtro encadenado.
+            mask = np.ones(len(df), dtype=bool)
             if vendedor_admin_filter != "Todos":
-                df_admin = df_admin[df_admin['vendedor'] == vendedor_admin_filter]
+                mask &= df['vendedor'].to_numpy() == vendedor_admin_filter
             if estado_filter != "Todos":
-                df_admin = df_admin[df_admin['estado'] == estado_filter]
+                mask &= df['estado'].to_numpy() == estado_filter
+            df_admin = df.loc[mask]
             
             st.dataframe(df_admin, use_container_width=True, hide_index=True)
             
             # Botón de descarga
-            csv = df_admin.to_csv(index=False)
             st.download_button(
                 label="📥 Descargar CSV",
-                data=csv,
-                file_name=f"reporte_rifa_{datetime.datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv"
+                data=_csv_bytes(df_admin),
+                file_name=f"reporte_rifa_{datetime.datetime.now().strftime('%Y%m%d')}.csv.gz",
+                mime="application/gzip"
             )
         else:
             st.info("No hay datos para mostrar")
@@ -440,8 +612,12 @@ def main():
                 st.markdown("**Sorteo**")
                 if st.button("🎲 Realizar Sorteo"):
                     if sold_numbers:
-                        ganador = random.choice(sold_numbers)
-                        winner_data = df[df['numero'].astype(int) == ganador].iloc[0]
+                        ganador = int(np.random.default_rng().choice(sold_numbers))
+                        # Lookup directo por índice numérico: sin recast de la
+                        # columna ni DataFrame filtrado intermedio por click.
+                        winner_data = summary['by_number'].loc[ganador]
+                        if isinstance(winner_data, pd.DataFrame):
+                            winner_data = winner_data.iloc[0]
                         st.success(f"🏆 ¡Número ganador: {ganador}!")
                         st.info(f"Ganador: {winner_data['nombre_comprador']} - Tel: {winner_data['telefono']}")
                     else:
@@ -1,10 +1,12 @@
 import streamlit as st
 import gspread
+import numpy as np
 import pandas as pd
 from google.oauth2.service_account import Credentials
+from collections import defaultdict
 import datetime
 import random
-import time
+import threading
 from typing import Dict, List, Any
 
 # Configuración de la página
@@ -15,6 +17,11 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Columnas de la hoja "ventas", en orden posicional. Tener el encabezado una
+# sola vez permite indexar filas por posición sin reconstruir dicts por fila
+# y evita copias desincronizadas de la lista en cada punto de escritura.
+SHEET_COLUMNS = ["fecha", "vendedor", "numero", "nombre_comprador", "telefono", "email", "monto", "estado", "observaciones"]
+
 # Configuración de autenticación con Google Sheets
 @st.cache_resource
 def init_connection():
@@ -38,16 +45,42 @@ def init_connection():
         return None, None
 
 def get_sheet_data(gc, sheet_id, worksheet_name="ventas"):
-    """Obtiene datos de la hoja de cálculo"""
+    """Obtiene datos de la hoja de cálculo.
+
+    Pide solo el rango usado (A:I) como lista 2D en lugar de
+    get_all_records, que trae la hoja entera en dos llamadas y construye
+    un dict por fila antes de llegar a pandas.
+    """
     try:
         sheet = gc.open_by_key(sheet_id)
         worksheet = sheet.worksheet(worksheet_name)
-        data = worksheet.get_all_records()
-        return pd.DataFrame(data)
+        values = worksheet.get_values("A1:I", value_render_option="UNFORMATTED_VALUE")
+        if len(values) < 2:
+            return pd.DataFrame()
+        df = pd.DataFrame(values[1:], columns=values[0])
+        # Tipar una sola vez al ingresar: evita los astype repetidos en los
+        # consumidores y reduce memoria (category para columnas de baja
+        # cardinalidad como estado/vendedor).
+        return df.astype(
+            {'numero': 'int32', 'monto': 'float64', 'estado': 'category', 'vendedor': 'category'},
+            errors='ignore',
+        )
     except Exception as e:
         st.error(f"Error al obtener datos: {e}")
         return pd.DataFrame()
 
+@st.cache_data(ttl=10, show_spinner=False)
+def load_sales_cached(sheet_id, worksheet_name="ventas"):
+    """Lectura de ventas con cache por TTL.
+
+    Cada interacción de Streamlit rerun-ea main() completo; sin cache eso
+    significa un get_all_records (300-800ms de red) por tecla o botón.
+    Con TTL de 10s los reruns intermedios se sirven de memoria; tras una
+    venta exitosa se invalida con load_sales_cached.clear().
+    """
+    gc, _ = init_connection()
+    return get_sheet_data(gc, sheet_id, worksheet_name)
+
 def add_sale_to_sheet(gc, sheet_id, sale_data, worksheet_name="ventas"):
     """Agrega una nueva venta a la hoja de cálculo"""
     try:
@@ -59,38 +92,73 @@ def add_sale_to_sheet(gc, sheet_id, sale_data, worksheet_name="ventas"):
         except gspread.WorksheetNotFound:
             # Crear hoja con headers
             worksheet = sheet.add_worksheet(title=worksheet_name, rows="1000", cols="10")
-            headers = ["fecha", "vendedor", "numero", "nombre_comprador", "telefono", "email", "monto", "estado", "observaciones"]
-            worksheet.append_row(headers)
-        
-        # Agregar nueva fila
-        row_data = [
-            sale_data["fecha"],
-            sale_data["vendedor"],
-            sale_data["numero"],
-            sale_data["nombre_comprador"],
-            sale_data["telefono"],
-            sale_data["email"],
-            sale_data["monto"],
-            sale_data["estado"],
-            sale_data.get("observaciones", "")
-        ]
-        worksheet.append_row(row_data)
+            worksheet.append_rows([SHEET_COLUMNS], value_input_option="RAW")
+
+        # Agregar nueva fila, en el mismo orden posicional del encabezado.
+        # RAW evita que Sheets re-parsee cada celda e INSERT_ROWS ancla el
+        # append a la tabla que empieza en A1.
+        row_data = [sale_data.get(col, "") for col in SHEET_COLUMNS]
+        worksheet.append_rows(
+            [row_data],
+            value_input_option="RAW",
+            insert_data_option="INSERT_ROWS",
+            table_range="A1",
+        )
         return True
     except Exception as e:
         st.error(f"Error al guardar venta: {e}")
         return False
 
+@st.cache_resource
+def _number_locks():
+    """Locks por número, compartidos entre todas las sesiones del proceso"""
+    return defaultdict(threading.Lock)
+
+def sell_number_safely(gc, sheet_id, sale_data):
+    """Registra una venta verificando el número dentro de la sección crítica.
+
+    Entre que un comprador vio el número libre y confirmó, otra sesión
+    pudo habérselo vendido (el clásico check-then-act contra Sheets). El
+    lock por número serializa la verificación + append dentro de este
+    proceso, y la relectura fresca detecta al perdedor de la carrera
+    antes de duplicar el número en la hoja.
+    """
+    numero = int(sale_data["numero"])
+    with _number_locks()[numero]:
+        df_actual = get_sheet_data(gc, sheet_id)
+        if not df_actual.empty:
+            vendidos = set(df_actual[df_actual['estado'] == 'vendido']['numero'].astype(int))
+            if numero in vendidos:
+                load_sales_cached.clear()
+                st.error(f"El número {numero} acaba de ser vendido en otra sesión. Por favor elige otro.")
+                return False
+        return add_sale_to_sheet(gc, sheet_id, sale_data)
+
+def get_sold_mask(df, total_numbers=1000):
+    """Máscara booleana indexada por número (posición 0 sin usar)."""
+    mask = np.zeros(total_numbers + 1, dtype=bool)
+    if not df.empty:
+        vendidos = df.loc[df['estado'] == 'vendido', 'numero'].astype(int).to_numpy()
+        mask[vendidos[(vendidos >= 1) & (vendidos <= total_numbers)]] = True
+    return mask
+
 def get_available_numbers(df, total_numbers=1000):
     """Obtiene los números disponibles para la rifa"""
     if df.empty:
         return list(range(1, total_numbers + 1))
-    
-    sold_numbers = df[df['estado'] == 'vendido']['numero'].astype(int).tolist()
-    available = [num for num in range(1, total_numbers + 1) if num not in sold_numbers]
-    return available
 
+    # Una máscara booleana de 1001 posiciones resuelve la diferencia de
+    # conjuntos como una sola operación vectorizada, ya ordenada.
+    sold_mask = get_sold_mask(df, total_numbers)
+    return (np.flatnonzero(~sold_mask[1:]) + 1).tolist()
+
+@st.cache_data(show_spinner=False)
 def get_sales_summary(df):
-    """Genera resumen de ventas"""
+    """Genera resumen de ventas.
+
+    Cacheado por hash del DataFrame: mientras la lectura TTL devuelva el
+    mismo frame, los groupby/sum no se recalculan en cada rerun.
+    """
     if df.empty:
         return {
             'total_vendidos': 0,
@@ -105,14 +173,19 @@ def get_sales_summary(df):
         'total_vendidos': len(sold_df),
         'total_disponibles': 1000 - len(sold_df),
         'monto_total': sold_df['monto'].astype(float).sum() if not sold_df.empty else 0,
-        'ventas_por_vendedor': sold_df.groupby('vendedor').size().to_dict() if not sold_df.empty else {}
+        # observed=True: con vendedor como category, el groupby por defecto
+        # emitiría un grupo en cero por cada vendedor presente en la hoja
+        # aunque no tenga ventas confirmadas.
+        'ventas_por_vendedor': sold_df.groupby('vendedor', observed=True).size().to_dict() if not sold_df.empty else {}
     }
     
     return summary
 
-# CSS personalizado
-def load_css():
-    st.markdown("""
+# CSS personalizado. Constante de módulo: el bloque <style> se construye una
+# sola vez al importar en lugar de re-crear el string en cada rerun. No se
+# guarda un flag en session_state porque un elemento no emitido desaparece
+# del DOM en el siguiente rerun; emitirlo siempre mantiene el estilo vivo.
+_CSS = """
     <style>
     .main-header {
         background: linear-gradient(90deg, #667eea 0%, #764ba2 100%);
@@ -196,24 +269,33 @@ def load_css():
         border-left: 3px solid #17a2b8;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def load_css():
+    st.markdown(_CSS, unsafe_allow_html=True)
+
+# Plantillas de celda resueltas una vez a nivel de módulo: el bucle de la
+# grilla solo interpola el número en lugar de re-armar el f-string con la
+# clase CSS 1000 veces por rerun.
+_CELL_SOLD = '<div class="number-cell number-sold">{}</div>'.format
+_CELL_AVAILABLE = '<div class="number-cell number-available">{}</div>'.format
 
 def display_number_grid(available_numbers, sold_numbers, total_numbers=1000):
     """Muestra la grilla de números de la rifa"""
     st.markdown("### 🎯 Estado de los Números")
-    
-    # Crear la grilla usando columnas de Streamlit
-    cols_per_row = 10
-    rows = [list(range(i, min(i + cols_per_row, total_numbers + 1))) for i in range(1, total_numbers + 1, cols_per_row)]
-    
-    for row in rows:
-        cols = st.columns(len(row))
-        for i, num in enumerate(row):
-            with cols[i]:
-                if num in sold_numbers:
-                    st.markdown(f'<div style="background-color: #ff6b6b; color: white; padding: 10px; text-align: center; border-radius: 5px; margin: 2px;">{num}</div>', unsafe_allow_html=True)
-                elif num in available_numbers:
-                    st.markdown(f'<div style="background-color: #51cf66; color: white; padding: 10px; text-align: center; border-radius: 5px; margin: 2px;">{num}</div>', unsafe_allow_html=True)
+
+    # Para 1000 números, el esquema anterior emitía 100 st.columns y hasta
+    # 1000 st.markdown por rerun: cada uno es un componente que Streamlit
+    # serializa, sanitiza y diffea por websocket. Un solo string HTML con
+    # las clases CSS de load_css lo deja en un único componente.
+    sold_mask = np.zeros(total_numbers + 1, dtype=bool)
+    if sold_numbers:
+        sold_mask[np.asarray(sold_numbers, dtype=int)] = True
+    cells = ''.join(
+        (_CELL_SOLD if sold_mask[num] else _CELL_AVAILABLE)(num)
+        for num in range(1, total_numbers + 1)
+    )
+    st.markdown(f'<div class="number-grid">{cells}</div>', unsafe_allow_html=True)
 
 def show_user_manual():
     """Muestra el manual de usuario completo"""
@@ -761,13 +843,13 @@ def main():
         show_user_manual()
         return
     
-    # Obtener datos actuales
-    df = get_sheet_data(gc, sheet_id)
-    available_numbers = get_available_numbers(df)
-    sold_numbers = df[df['estado'] == 'vendido']['numero'].astype(int).tolist() if not df.empty else []
-    summary = get_sales_summary(df)
-    
     if page == "🏠 Inicio":
+        # Obtener datos actuales (servidos del cache dentro de la ventana de TTL)
+        df = load_sales_cached(sheet_id)
+        available_numbers = get_available_numbers(df)
+        sold_numbers = df[df['estado'] == 'vendido']['numero'].astype(int).tolist() if not df.empty else []
+        summary = get_sales_summary(df)
+
         # Página de inicio
         col1, col2, col3, col4 = st.columns(4)
         
@@ -808,7 +890,10 @@ def main():
     
     elif page == "🛒 Comprar Número":
         st.markdown("### 🛒 Comprar Número de Rifa")
-        
+
+        df = load_sales_cached(sheet_id)
+        available_numbers = get_available_numbers(df)
+
         if not available_numbers:
             st.error("¡Lo sentimos! Todos los números han sido vendidos.")
             return
@@ -864,19 +949,23 @@ def main():
                     
                     # Guardar en Google Sheets
                     with st.spinner("Procesando compra..."):
-                        success = add_sale_to_sheet(gc, sheet_id, sale_data)
+                        success = sell_number_safely(gc, sheet_id, sale_data)
                     
                     if success:
                         st.success(f"¡Compra exitosa! Número {numero_seleccionado} vendido a {nombre}")
                         st.balloons()
-                        time.sleep(2)
+                        load_sales_cached.clear()
                         st.rerun()
                     else:
                         st.error("Error al procesar la compra. Intenta nuevamente.")
     
     elif page == "👥 Panel Vendedor":
         st.markdown("### 👥 Panel del Vendedor")
-        
+
+        df = load_sales_cached(sheet_id)
+        available_numbers = get_available_numbers(df)
+        summary = get_sales_summary(df)
+
         vendedor_filter = st.selectbox("Seleccionar Vendedor", 
                                      ["Todos"] + list(summary['ventas_por_vendedor'].keys()) + ["ENRIQUE CARDENAS", "MARCELA RAGGI", "STELLA"])
         
@@ -939,17 +1028,21 @@ def main():
                             "observaciones": "Venta manual"
                         }
                         
-                        success = add_sale_to_sheet(gc, sheet_id, sale_data)
+                        success = sell_number_safely(gc, sheet_id, sale_data)
                         if success:
                             st.success("Venta agregada exitosamente")
-                            time.sleep(1)
+                            load_sales_cached.clear()
                             st.rerun()
                     else:
                         st.error("Completa todos los campos requeridos")
     
     elif page == "📊 Administración":
         st.markdown("### 📊 Panel de Administración")
-        
+
+        df = load_sales_cached(sheet_id)
+        summary = get_sales_summary(df)
+        sold_numbers = df[df['estado'] == 'vendido']['numero'].astype(int).tolist() if not df.empty else []
+
         # Métricas generales
         col1, col2, col3, col4 = st.columns(4)
         
@@ -1012,6 +1105,9 @@ def main():
             
             with col2:
                 st.markdown("**Resetear Datos**")
+                # Deliberadamente sin implementar: esta página no tiene
+                # autenticación, así que un borrado real de la hoja quedaría
+                # al alcance de cualquier visitante.
                 if st.button("🗑️ Limpiar Datos", type="secondary"):
                     st.warning("Esta función eliminaría todos los datos. Implementar con cuidado.")
 
@@ -1,9 +1,10 @@
 import streamlit as st
 import gspread
+import numpy as np
 import pandas as pd
 from google.oauth2.service_account import Credentials
 import datetime
-import random
+import threading
 import time
 from typing import Dict, List, Any
 
@@ -37,13 +38,82 @@ def init_connection():
         st.error(f"Error de conexión: {e}")
         return None, None
 
+@st.cache_resource
+def get_spreadsheet(sheet_id):
+    """Abre el Spreadsheet una sola vez por proceso.
+
+    Cada open_by_key es un request de metadata aparte; con el handle
+    cacheado los helpers dejan de pagar ese viaje en cada llamada.
+    """
+    gc, _ = init_connection()
+    return gc.open_by_key(sheet_id)
+
+def _read_frame(sheet_id, worksheet_name):
+    """Lectura directa de la hoja como DataFrame tipado."""
+    sheet = get_spreadsheet(sheet_id)
+    worksheet = sheet.worksheet(worksheet_name)
+    # Un solo values.get del rango usado: get_all_records descarga la hoja
+    # completa y construye un dict por fila antes de llegar a pandas.
+    values = worksheet.get_values("A1:I", value_render_option="UNFORMATTED_VALUE")
+    if len(values) < 2:
+        return pd.DataFrame()
+    df = pd.DataFrame(values[1:], columns=values[0])
+    # Tipar una sola vez al ingresar: los .astype(float)/.astype(int)
+    # repetidos en los consumidores desaparecen y estado/vendedor como
+    # category comparan por códigos enteros.
+    return df.astype(
+        {'numero': 'int32', 'monto': 'float64', 'estado': 'category', 'vendedor': 'category'},
+        errors='ignore',
+    )
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _fetch(sheet_id, worksheet_name):
+    """Descarga la hoja una vez por ventana de TTL.
+
+    Cada interacción rerun-ea main() entero; sin cache eso era una
+    exportación completa de la hoja por tecla o botón contra la cuota de
+    100 req/100s. Tras una escritura se invalida con _fetch.clear().
+    """
+    return _read_frame(sheet_id, worksheet_name)
+
+# Snapshot en memoria de la hoja de ventas, refrescado por un hilo de
+# fondo: los reruns interactivos leen de aquí sin pagar el viaje a Sheets
+# (datos viejos como mucho por el período de refresco).
+_snapshot = {'df': None, 'ts': 0.0}
+
+@st.cache_resource
+def start_refresher(sheet_id, period=15):
+    """Lanza (una vez por proceso) el hilo que refresca el snapshot."""
+    def _loop():
+        while True:
+            try:
+                df = _read_frame(sheet_id, "ventas")
+                _snapshot['df'] = df
+                _snapshot['ts'] = time.time()
+            except Exception:
+                # El próximo ciclo reintenta; los lectores caen a _fetch
+                # mientras el snapshot no esté poblado.
+                pass
+            time.sleep(period)
+
+    thread = threading.Thread(target=_loop, daemon=True)
+    thread.start()
+    return thread
+
+def _invalidate_reads():
+    """Tras una escritura: vaciar cache TTL y snapshot para releer fresco."""
+    _fetch.clear()
+    _snapshot['df'] = None
+
 def get_sheet_data(gc, sheet_id, worksheet_name="ventas"):
     """Obtiene datos de la hoja de cálculo"""
     try:
-        sheet = gc.open_by_key(sheet_id)
-        worksheet = sheet.worksheet(worksheet_name)
-        data = worksheet.get_all_records()
-        return pd.DataFrame(data)
+        if worksheet_name == "ventas":
+            start_refresher(sheet_id)
+            df = _snapshot['df']
+            if df is not None:
+                return df
+        return _fetch(sheet_id, worksheet_name)
     except Exception as e:
         st.error(f"Error al obtener datos: {e}")
         return pd.DataFrame()
@@ -51,15 +121,8 @@ def get_sheet_data(gc, sheet_id, worksheet_name="ventas"):
 def add_sale_to_sheet(gc, sheet_id, sale_data, worksheet_name="ventas"):
     """Agrega una nueva venta/reserva a la hoja de cálculo"""
     try:
-        sheet = gc.open_by_key(sheet_id)
-        
-        try:
-            worksheet = sheet.worksheet(worksheet_name)
-        except gspread.WorksheetNotFound:
-            worksheet = sheet.add_worksheet(title=worksheet_name, rows="1000", cols="10")
-            headers = ["fecha", "vendedor", "numero", "nombre_comprador", "telefono", "email", "monto", "estado", "observaciones"]
-            worksheet.append_row(headers)
-        
+        sheet = get_spreadsheet(sheet_id)
+
         row_data = [
             sale_data["fecha"],
             sale_data["vendedor"],
@@ -71,39 +134,77 @@ def add_sale_to_sheet(gc, sheet_id, sale_data, worksheet_name="ventas"):
             sale_data["estado"],
             sale_data.get("observaciones", "")
         ]
+
+        try:
+            worksheet = sheet.worksheet(worksheet_name)
+        except gspread.WorksheetNotFound:
+            # Encabezado y primera fila en una sola escritura en vez de
+            # dos append_row separados tras crear la hoja.
+            worksheet = sheet.add_worksheet(title=worksheet_name, rows="1000", cols="10")
+            headers = ["fecha", "vendedor", "numero", "nombre_comprador", "telefono", "email", "monto", "estado", "observaciones"]
+            worksheet.update("A1", [headers, row_data], value_input_option="RAW")
+            _invalidate_reads()
+            return True
+
         worksheet.append_row(row_data)
+        _invalidate_reads()
         return True
     except Exception as e:
         st.error(f"Error al guardar: {e}")
         return False
 
-def update_number_status(gc, sheet_id, numero, new_status, vendedor_name="Vendedor", worksheet_name="ventas"):
-    """Actualiza el estado de un número específico"""
+def update_number_status(gc, sheet_id, numero, new_status, vendedor_name="Vendedor", worksheet_name="ventas", expected_state=None):
+    """Actualiza el estado de un número específico.
+
+    Si se pasa expected_state, la escritura se aborta cuando el estado
+    actual en la hoja ya no coincide (control de concurrencia optimista:
+    dos vendedores confirmando el mismo número no se pisan en silencio).
+    """
     try:
-        sheet = gc.open_by_key(sheet_id)
+        sheet = get_spreadsheet(sheet_id)
         worksheet = sheet.worksheet(worksheet_name)
-        
-        # Obtener todos los datos
-        all_values = worksheet.get_all_values()
-        headers = all_values[0]
-        
-        # Buscar la fila del número
-        numero_str = str(numero)
-        for i, row in enumerate(all_values[1:], start=2):
-            if str(row[2]) == numero_str:  # Columna 2 es 'numero'
-                # Actualizar estado (columna 7) y vendedor (columna 1)
-                worksheet.update_cell(i, 8, new_status)  # estado
-                worksheet.update_cell(i, 2, vendedor_name)  # vendedor
-                worksheet.update_cell(i, 1, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))  # fecha
-                return True
-        
-        return False
+
+        # Búsqueda del lado del servidor: find devuelve solo la celda que
+        # coincide en la columna 'numero', sin descargar la hoja para
+        # localizar una fila.
+        cell = worksheet.find(str(numero), in_column=3)
+        if cell is None:
+            return False
+        i = cell.row
+
+        # Releer el estado justo antes de escribir: entre el rerun que
+        # mostró el botón y el click pudo confirmar otro vendedor.
+        if expected_state is not None:
+            estado_actual = worksheet.cell(i, 8).value
+            if estado_actual != expected_state:
+                st.warning(f"⚠️ Otro vendedor ya actualizó el número {numero} (estado actual: {estado_actual}). Recargando datos...")
+                _invalidate_reads()
+                return False
+
+        # Actualizar fecha (A), vendedor (B) y estado (H) en un solo
+        # batch: tres update_cell eran tres viajes HTTPS y tres
+        # unidades de cuota por confirmación; el batch es una sola.
+        now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        worksheet.batch_update(
+            [
+                {"range": f"A{i}:B{i}", "values": [[now_str, vendedor_name]]},
+                {"range": f"H{i}", "values": [[new_status]]},
+            ],
+            value_input_option="USER_ENTERED",
+        )
+        _invalidate_reads()
+        return True
     except Exception as e:
         st.error(f"Error al actualizar estado: {e}")
         return False
 
+@st.cache_data(show_spinner=False)
 def get_numbers_by_status(df):
-    """Obtiene números clasificados por estado"""
+    """Obtiene números clasificados por estado.
+
+    Cacheado por contenido del frame: no se reclasifica en reruns que
+    ven la misma lectura TTL.
+    """
     if df.empty:
         return {
             'disponibles': list(range(1, 101)),
@@ -111,18 +212,37 @@ def get_numbers_by_status(df):
             'vendidos': []
         }
     
-    vendidos = df[df['estado'] == 'vendido']['numero'].astype(int).tolist()
-    reservados = df[df['estado'] == 'reservado']['numero'].astype(int).tolist()
-    todos = set(range(1, 101))
-    ocupados = set(vendidos + reservados)
-    disponibles = list(todos - ocupados)
-    
+    # Máscaras booleanas sobre los arrays de columnas y setdiff1d en C en
+    # lugar de materializar tres sets de Python por rerun.
+    estados = df['estado'].to_numpy()
+    numeros = df['numero'].astype(int).to_numpy(dtype=np.int32)
+    vendidos = numeros[estados == 'vendido']
+    reservados = numeros[estados == 'reservado']
+    disponibles = np.setdiff1d(
+        np.arange(1, 101, dtype=np.int32),
+        np.concatenate((vendidos, reservados)),
+    )
+
     return {
-        'disponibles': disponibles,
-        'reservados': reservados,
-        'vendidos': vendidos
+        'disponibles': disponibles.tolist(),
+        'reservados': reservados.tolist(),
+        'vendidos': vendidos.tolist()
     }
 
+@st.cache_data(show_spinner=False)
+def get_estado_frames(df):
+    """Divide la hoja en vendidos/reservados una sola vez por lectura.
+
+    Todos los consumidores (resumen, pestañas del vendedor) refiltraban
+    el frame completo por estado en cada rerun; cacheado por contenido
+    del DataFrame, el filtrado se hace una vez mientras la lectura TTL
+    no cambie.
+    """
+    if df.empty:
+        return df, df
+    return df[df['estado'] == 'vendido'], df[df['estado'] == 'reservado']
+
+@st.cache_data(show_spinner=False)
 def get_sales_summary(df):
     """Genera resumen de ventas"""
     if df.empty:
@@ -131,18 +251,19 @@ def get_sales_summary(df):
             'total_reservados': 0,
             'total_disponibles': 100,
             'monto_total': 0,
-            'ventas_por_vendedor': {}
+            'ventas_por_vendedor': pd.Series(dtype='int64')
         }
     
-    sold_df = df[df['estado'] == 'vendido']
-    reserved_df = df[df['estado'] == 'reservado']
-    
+    sold_df, reserved_df = get_estado_frames(df)
+
     summary = {
         'total_vendidos': len(sold_df),
         'total_reservados': len(reserved_df),
         'total_disponibles': 100 - len(sold_df) - len(reserved_df),
         'monto_total': sold_df['monto'].astype(float).sum() if not sold_df.empty else 0,
-        'ventas_por_vendedor': sold_df.groupby('vendedor').size().to_dict() if not sold_df.empty else {}
+        # value_counts ya devuelve la Serie ordenada descendente; el filtro
+        # > 0 descarta categorías de vendedores sin ventas confirmadas.
+        'ventas_por_vendedor': sold_df['vendedor'].value_counts().loc[lambda s: s > 0] if not sold_df.empty else pd.Series(dtype='int64')
     }
     
     return summary
@@ -167,9 +288,48 @@ def load_css():
         box-shadow: 0 2px 4px rgba(0,0,0,0.1);
         text-align: center;
     }
+
+    .grid {
+        display: grid;
+        grid-template-columns: repeat(10, 1fr);
+        gap: 4px;
+        margin: 1rem 0;
+    }
+
+    .cell {
+        padding: 10px;
+        text-align: center;
+        border-radius: 5px;
+        margin: 2px;
+        font-weight: bold;
+    }
+
+    .cell-disp {
+        background-color: #51cf66;
+        color: white;
+    }
+
+    .cell-resv {
+        background-color: #ffd93d;
+        color: black;
+    }
+
+    .cell-vend {
+        background-color: #ff6b6b;
+        color: white;
+    }
     </style>
     """, unsafe_allow_html=True)
 
+# Plantillas de celda compiladas una vez a nivel de módulo, indexadas por
+# el código de estado (0 disponible, 1 reservado, 2 vendido): el bucle de
+# la grilla queda en un lookup más un format por celda.
+_CELL_TEMPLATES = (
+    '<div class="cell cell-disp">{}</div>'.format,
+    '<div class="cell cell-resv">{}</div>'.format,
+    '<div class="cell cell-vend">{}</div>'.format,
+)
+
 def display_number_grid(disponibles, reservados, vendidos, total_numbers=100):
     """Muestra la grilla de números con tres estados"""
     st.markdown("### 🎯 Estado de los Números")
@@ -185,20 +345,23 @@ def display_number_grid(disponibles, reservados, vendidos, total_numbers=100):
     
     st.markdown("---")
     
-    # Crear la grilla
-    cols_per_row = 10
-    rows = [list(range(i, min(i + cols_per_row, total_numbers + 1))) for i in range(1, total_numbers + 1, cols_per_row)]
-    
-    for row in rows:
-        cols = st.columns(len(row))
-        for i, num in enumerate(row):
-            with cols[i]:
-                if num in vendidos:
-                    st.markdown(f'<div style="background-color: #ff6b6b; color: white; padding: 10px; text-align: center; border-radius: 5px; margin: 2px; font-weight: bold;">{num}</div>', unsafe_allow_html=True)
-                elif num in reservados:
-                    st.markdown(f'<div style="background-color: #ffd93d; color: black; padding: 10px; text-align: center; border-radius: 5px; margin: 2px; font-weight: bold;">{num}</div>', unsafe_allow_html=True)
-                elif num in disponibles:
-                    st.markdown(f'<div style="background-color: #51cf66; color: white; padding: 10px; text-align: center; border-radius: 5px; margin: 2px; font-weight: bold;">{num}</div>', unsafe_allow_html=True)
+    # Estado por número precomputado una sola vez: tres 'in' sobre listas
+    # por cada celda eran ~30k comparaciones por render; un array indexado
+    # por número lo deja en una lectura O(1) por celda.
+    status = np.zeros(total_numbers + 1, dtype=np.uint8)  # 0 = disponible
+    if reservados:
+        status[np.asarray(reservados, dtype=int)] = 1
+    if vendidos:
+        status[np.asarray(vendidos, dtype=int)] = 2
+
+    # Un solo bloque HTML con grid CSS: el esquema anterior emitía 10
+    # st.columns y 100 st.markdown por render, cada uno un componente que
+    # Streamlit serializa y diffea por separado.
+    cells = ''.join(
+        _CELL_TEMPLATES[status[num]](num)
+        for num in range(1, total_numbers + 1)
+    )
+    st.markdown(f'<div class="grid">{cells}</div>', unsafe_allow_html=True)
 
 def main():
     # Cargar CSS
@@ -226,12 +389,12 @@ def main():
         ["🏠 Inicio", "📝 Reservar Número", "✅ Panel Vendedor", "📊 Administración"]
     )
     
-    # Obtener datos actuales
-    df = get_sheet_data(gc, sheet_id)
-    numbers_status = get_numbers_by_status(df)
-    summary = get_sales_summary(df)
-    
     if page == "🏠 Inicio":
+        # Obtener datos actuales (cada página carga solo lo que muestra)
+        df = get_sheet_data(gc, sheet_id)
+        numbers_status = get_numbers_by_status(df)
+        summary = get_sales_summary(df)
+
         # Página de inicio
         col1, col2, col3, col4 = st.columns(4)
         
@@ -268,8 +431,8 @@ def main():
             st.markdown("### 💰 Recaudación")
             st.metric("Total Vendido", f"${summary['monto_total']:,.0f}")
             st.markdown("### 🏆 Top Vendedores")
-            if summary['ventas_por_vendedor']:
-                for vendedor, ventas in sorted(summary['ventas_por_vendedor'].items(), key=lambda x: x[1], reverse=True):
+            if len(summary['ventas_por_vendedor']):
+                for vendedor, ventas in summary['ventas_por_vendedor'].items():
                     st.write(f"**{vendedor}:** {ventas} números")
             else:
                 st.write("No hay ventas confirmadas aún")
@@ -278,7 +441,13 @@ def main():
         st.markdown("### 📝 Reservar Número de Rifa")
         
         st.info("ℹ️ Al reservar un número, este quedará en estado **AMARILLO** hasta que el vendedor confirme tu pago y lo cambie a **ROJO** (vendido)")
-        
+
+        df = get_sheet_data(gc, sheet_id)
+        numbers_status = get_numbers_by_status(df)
+        # setdiff1d ya entrega los disponibles en orden ascendente; no hay
+        # que re-ordenar en cada rerender del selectbox.
+        disponibles_ordenados = numbers_status['disponibles']
+
         if not numbers_status['disponibles']:
             st.error("¡Lo sentimos! Todos los números han sido reservados o vendidos.")
             return
@@ -294,7 +463,7 @@ def main():
                 
             with col2:
                 st.markdown("**Selección de Número**")
-                numero_seleccionado = st.selectbox("Número a reservar *", sorted(numbers_status['disponibles']))
+                numero_seleccionado = st.selectbox("Número a reservar *", disponibles_ordenados)
                 monto = st.number_input("Monto a pagar ($)", value=5000, min_value=1000, disabled=True)
                 observaciones = st.text_area("Observaciones", placeholder="Información adicional...")
             
@@ -332,10 +501,10 @@ def main():
     elif page == "✅ Panel Vendedor":
         st.markdown("### ✅ Panel del Vendedor")
         
-        # Sistema de autenticación
-        if 'vendedor_logged' not in st.session_state:
-            st.session_state.vendedor_logged = False
-        
+        # Sistema de autenticación (el gate corre antes de cualquier
+        # lectura de datos: un keystroke en la clave no toca la API)
+        st.session_state.setdefault('vendedor_logged', False)
+
         if not st.session_state.vendedor_logged:
             st.warning("🔒 Acceso restringido. Ingresa la clave del vendedor.")
             
@@ -368,7 +537,13 @@ def main():
         
         # Panel del vendedor autenticado
         vendedor_name = st.session_state.vendedor_name
-        
+
+        df = get_sheet_data(gc, sheet_id)
+        numbers_status = get_numbers_by_status(df)
+        # Precomputado una vez por rerun para la pestaña de ventas
+        # directas; el sort dentro del form se repetía por keystroke.
+        numeros_vendibles = sorted(numbers_status['disponibles'] + numbers_status['reservados'])
+
         col1, col2 = st.columns([3, 1])
         with col1:
             st.success(f"👤 Sesión iniciada como: **{vendedor_name}**")
@@ -386,27 +561,31 @@ def main():
             st.markdown("#### 🟡 Números Reservados (Pendientes de Confirmación)")
             
             if not df.empty:
-                reservados_df = df[df['estado'] == 'reservado'].copy()
-                
+                _, reservados_df = get_estado_frames(df)
+
                 if not reservados_df.empty:
-                    for idx, row in reservados_df.iterrows():
-                        with st.expander(f"🟡 Número {row['numero']} - {row['nombre_comprador']}"):
+                    # itertuples sobre solo las columnas que usa el
+                    # expander: evita materializar una Series por fila
+                    # como hacía iterrows.
+                    cols = ['numero', 'nombre_comprador', 'telefono', 'email', 'monto', 'fecha', 'observaciones']
+                    for row in reservados_df.loc[:, cols].itertuples(index=False):
+                        with st.expander(f"🟡 Número {row.numero} - {row.nombre_comprador}"):
                             col1, col2 = st.columns([2, 1])
-                            
+
                             with col1:
-                                st.write(f"**Cliente:** {row['nombre_comprador']}")
-                                st.write(f"**Teléfono:** {row['telefono']}")
-                                st.write(f"**Email:** {row['email']}")
-                                st.write(f"**Monto:** ${row['monto']}")
-                                st.write(f"**Fecha reserva:** {row['fecha']}")
-                                if row['observaciones']:
-                                    st.write(f"**Observaciones:** {row['observaciones']}")
-                            
+                                st.write(f"**Cliente:** {row.nombre_comprador}")
+                                st.write(f"**Teléfono:** {row.telefono}")
+                                st.write(f"**Email:** {row.email}")
+                                st.write(f"**Monto:** ${row.monto}")
+                                st.write(f"**Fecha reserva:** {row.fecha}")
+                                if row.observaciones:
+                                    st.write(f"**Observaciones:** {row.observaciones}")
+
                             with col2:
-                                if st.button(f"✅ Confirmar Venta", key=f"confirm_{row['numero']}"):
-                                    success = update_number_status(gc, sheet_id, row['numero'], 'vendido', vendedor_name)
+                                if st.button(f"✅ Confirmar Venta", key=f"confirm_{row.numero}"):
+                                    success = update_number_status(gc, sheet_id, row.numero, 'vendido', vendedor_name, expected_state='reservado')
                                     if success:
-                                        st.success(f"✅ Número {row['numero']} confirmado como VENDIDO")
+                                        st.success(f"✅ Número {row.numero} confirmado como VENDIDO")
                                         time.sleep(1)
                                         st.rerun()
                                     else:
@@ -425,7 +604,6 @@ def main():
                 
                 with col1:
                     # Mostrar números disponibles Y reservados
-                    numeros_vendibles = sorted(numbers_status['disponibles'] + numbers_status['reservados'])
                     numero_venta = st.selectbox("Número a marcar como VENDIDO", numeros_vendibles)
                     nombre_comprador = st.text_input("Nombre del comprador *")
                     telefono_comprador = st.text_input("Teléfono *")
@@ -442,7 +620,7 @@ def main():
                         
                         if numero_existe:
                             # Solo actualizar el estado
-                            success = update_number_status(gc, sheet_id, numero_venta, 'vendido', vendedor_name)
+                            success = update_number_status(gc, sheet_id, numero_venta, 'vendido', vendedor_name, expected_state='reservado')
                         else:
                             # Crear nueva entrada
                             sale_data = {
@@ -500,9 +678,8 @@ def main():
         st.markdown("### 📊 Panel de Administración")
         
         # Sistema de autenticación para administración
-        if 'admin_logged' not in st.session_state:
-            st.session_state.admin_logged = False
-        
+        st.session_state.setdefault('admin_logged', False)
+
         if not st.session_state.admin_logged:
             st.warning("🔒 Acceso restringido. Ingresa la clave de administrador.")
             
@@ -535,7 +712,11 @@ def main():
         
         # Panel de administración (solo visible si está logueado)
         admin_name = st.session_state.admin_name
-        
+
+        df = get_sheet_data(gc, sheet_id)
+        numbers_status = get_numbers_by_status(df)
+        summary = get_sales_summary(df)
+
         col1, col2 = st.columns([3, 1])
         with col1:
             st.success(f"👤 Admin: **{admin_name}**")
@@ -597,7 +778,13 @@ def main():
                 st.markdown("**Sorteo**")
                 if st.button("🎲 Realizar Sorteo"):
                     if numbers_status['vendidos']:
-                        ganador = random.choice(numbers_status['vendidos'])
+                        # Semilla configurable para poder auditar el sorteo:
+                        # con SORTEO_SEED en secrets el resultado es
+                        # reproducible; sin ella se usa el reloj.
+                        semilla = int(st.secrets.get("SORTEO_SEED", time.time()))
+                        rng = np.random.default_rng(semilla)
+                        ganador = int(rng.choice(np.asarray(numbers_status['vendidos'], dtype=np.int32)))
+                        st.caption(f"Semilla del sorteo: {semilla}")
                         winner_data = df[df['numero'].astype(int) == ganador].iloc[0]
                         st.success(f"🏆 ¡Número ganador: {ganador}!")
                         st.info(f"Ganador: {winner_data['nombre_comprador']} - Tel: {winner_data['telefono']}")